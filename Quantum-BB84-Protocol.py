@@ -4,88 +4,164 @@ BB84 Quantum Key Distribution Protocol
 """
 
 import numpy as np
-from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
-from qiskit import transpile
-from qiskit_aer import Aer
-from qiskit.visualization import plot_histogram
-import random
-import hashlib
+import math
 
 class BB84Protocol:
     """
     Implementation of BB84 Quantum Key Distribution Protocol
     """
     
-    def __init__(self, key_length=16, eve_present=False):
+    def __init__(self, key_length=16, eve_present=False, simulate_circuits=False):
         """
         Initialize BB84 protocol
         
         Args:
             key_length: Desired length of the final key
             eve_present: Whether an eavesdropper (Eve) is present
+            simulate_circuits: Run every measurement as a Qiskit circuit on Aer
+                instead of sampling the outcomes directly with NumPy
         """
         self.key_length = key_length
         self.eve_present = eve_present
-        self.backend = Aer.get_backend('qasm_simulator')
+        self.simulate_circuits = simulate_circuits
+        self.backend = None
+        self._rng = np.random.default_rng()
+        
+        # Transpiled circuit for every (bit, basis, measurement basis)
+        self._templates = {}
+        if simulate_circuits:
+            # Qiskit is only needed for circuit simulation, so it is not
+            # imported until a protocol asks for it
+            from qiskit import transpile
+            from qiskit_aer import Aer
+            
+            self.backend = Aer.get_backend('qasm_simulator')
+            keys = [(bit, basis, measure_basis)
+                    for bit in (0, 1) for basis in (0, 1) for measure_basis in (0, 1)]
+            circuits = [self._build_template(*key) for key in keys]
+            
+            # X, H and measure are native to Aer, so there is nothing to optimize
+            transpiled = transpile(circuits, self.backend, optimization_level=0)
+            self._templates = dict(zip(keys, transpiled))
+        
+    def _build_template(self, bit, basis, measure_basis):
+        """
+        Build the single-qubit circuit preparing and measuring one qubit
+        
+        Args:
+            bit: Encoded bit (0 or 1)
+            basis: Preparation basis (0 for Z-basis, 1 for X-basis)
+            measure_basis: Measurement basis
+        
+        Returns:
+            Quantum circuit with one qubit and one classical bit
+        """
+        from qiskit import QuantumCircuit
+        
+        qc = QuantumCircuit(1, 1)
+        
+        # Prepare qubit based on bit value
+        if bit == 1:
+            qc.x(0)
+        
+        # Apply preparation basis
+        if basis == 1:  # X-basis (diagonal)
+            qc.h(0)
+        
+        # Apply measurement basis
+        if measure_basis == 1:  # X-basis
+            qc.h(0)
+        
+        qc.measure(0, 0)
         
+        return qc
+    
     def encode_message(self, bits, bases):
         """
         Alice encodes her bits using chosen bases
         
+        Each qubit is described by the (bit, basis) pair it was prepared
+        from, which fully determines its state (|0>, |1>, |+> or |->).
+        
         Args:
-            bits: List of bits to encode (0 or 1)
-            bases: List of bases to use (0 for Z-basis, 1 for X-basis)
+            bits: Bits to encode (0 or 1)
+            bases: Bases to use (0 for Z-basis, 1 for X-basis)
         
         Returns:
-            List of encoded quantum circuits
+            uint8 array of shape (n, 2) holding the (bit, basis) of each qubit
         """
-        message = []
-        for i in range(len(bits)):
-            qc = QuantumCircuit(1, 1)
-            
-            # Prepare qubit based on bit value
-            if bits[i] == 1:
-                qc.x(0)
-            
-            # Apply basis
-            if bases[i] == 1:  # X-basis (diagonal)
-                qc.h(0)
-                
-            message.append(qc)
+        bits = np.asarray(bits, dtype=np.uint8)
+        bases = np.asarray(bases, dtype=np.uint8)
         
-        return message
+        return np.stack([bits, bases], axis=1)
     
     def measure_message(self, message, bases):
         """
         Bob measures the qubits using his chosen bases
         
+        Measuring in the preparation basis returns the encoded bit, while
+        measuring in the other basis gives a uniformly random outcome.
+        
         Args:
-            message: List of quantum circuits
+            message: Array of (bit, basis) pairs
             bases: Bob's measurement bases
         
         Returns:
-            List of measurement results
+            uint8 array of measurement results
         """
-        measurements = []
+        if self.simulate_circuits:
+            return self._simulate_circuit(message, bases)
         
-        for i in range(len(message)):
-            qc = message[i].copy()
-            
-            # Apply Bob's measurement basis
-            if bases[i] == 1:  # X-basis
-                qc.h(0)
-            
-            # Measure
-            qc.measure(0, 0)
-            
-            # Execute circuit
-            job = self.backend.run(transpile(qc, self.backend), shots=1)
-            result = job.result()
-            counts = result.get_counts(qc)
-            
-            # Get the measurement result
-            measured_bit = int(list(counts.keys())[0])
-            measurements.append(measured_bit)
+        alice_bits = message[:, 0]
+        alice_bases = message[:, 1]
+        
+        match = alice_bases == np.asarray(bases, dtype=np.uint8)
+        random_bits = self._rng.integers(0, 2, len(message), dtype=np.uint8)
+        
+        return np.where(match, alice_bits, random_bits)
+    
+    def _simulate_circuit(self, message, bases):
+        """
+        Measure the qubits by running their Qiskit circuits on Aer
+        
+        Qubits sharing the same (bit, basis, measurement basis) run the
+        same cached template, so every template needed is submitted in a
+        single job and takes one shot per qubit from its outcomes.
+        
+        Args:
+            message: Array of (bit, basis) pairs
+            bases: Measurement bases
+        
+        Returns:
+            uint8 array of measurement results
+        """
+        bits = message[:, 0]
+        prep_bases = message[:, 1]
+        bases = np.asarray(bases, dtype=np.uint8)
+        
+        groups = []
+        for (bit, basis, measure_basis), template in self._templates.items():
+            indices = np.flatnonzero((bits == bit) & (prep_bases == basis) & (bases == measure_basis))
+            if len(indices) > 0:
+                groups.append((indices, template))
+        
+        measurements = np.empty(len(message), dtype=np.uint8)
+        if not groups:
+            return measurements
+        
+        # A job has a single shot count, so every template runs as many
+        # shots as the largest group needs; Aer spreads the experiments
+        # over all available cores
+        shots = max(len(indices) for indices, _ in groups)
+        job = self.backend.run([template for _, template in groups], shots=shots,
+                               memory=True, max_parallel_experiments=0)
+        result = job.result()
+        
+        for k, (indices, _) in enumerate(groups):
+            # Memory holds one outcome per shot; subtracting ord('0')
+            # turns the ASCII digits into bits
+            memory = ''.join(result.get_memory(k)[:len(indices)])
+            measurements[indices] = np.frombuffer(memory.encode('ascii'), dtype=np.uint8) - 48
         
         return measurements
     
@@ -94,39 +170,18 @@ class BB84Protocol:
         Eve intercepts and measures qubits (if present)
         
         Args:
-            message: List of quantum circuits
+            message: Array of (bit, basis) pairs
         
         Returns:
             Modified message after Eve's measurement
         """
-        eve_bases = [random.randint(0, 1) for _ in range(len(message))]
-        eve_results = []
-        intercepted_message = []
+        eve_bases = self._rng.integers(0, 2, len(message), dtype=np.uint8)
         
-        for i in range(len(message)):
-            qc = message[i].copy()
-            
-            # Eve measures in random basis
-            if eve_bases[i] == 1:
-                qc.h(0)
-            
-            qc.measure(0, 0)
-            
-            # Execute circuit
-            job = self.backend.run(transpile(qc, self.backend), shots=1)
-            result = job.result()
-            counts = result.get_counts(qc)
-            measured_bit = int(list(counts.keys())[0])
-            eve_results.append(measured_bit)
-            
-            # Eve prepares new qubit based on her measurement
-            new_qc = QuantumCircuit(1, 1)
-            if measured_bit == 1:
-                new_qc.x(0)
-            if eve_bases[i] == 1:
-                new_qc.h(0)
-            
-            intercepted_message.append(new_qc)
+        # Eve measures in random basis
+        eve_results = self.measure_message(message, eve_bases)
+        
+        # Eve prepares new qubits based on her measurement
+        intercepted_message = self.encode_message(eve_results, eve_bases)
         
         return intercepted_message, eve_results, eve_bases
     
@@ -141,15 +196,12 @@ class BB84Protocol:
             bob_bits: Bob's measured bits
         
         Returns:
-            Sifted keys for Alice and Bob
+            Sifted uint8 keys for Alice and Bob
         """
-        alice_key = []
-        bob_key = []
+        mask = np.asarray(alice_bases, dtype=np.uint8) == np.asarray(bob_bases, dtype=np.uint8)
         
-        for i in range(len(alice_bases)):
-            if alice_bases[i] == bob_bases[i]:
-                alice_key.append(alice_bits[i])
-                bob_key.append(bob_bits[i])
+        alice_key = np.asarray(alice_bits, dtype=np.uint8)[mask]
+        bob_key = np.asarray(bob_bits, dtype=np.uint8)[mask]
         
         return alice_key, bob_key
     
@@ -163,28 +215,28 @@ class BB84Protocol:
             sample_size: Number of bits to compare
         
         Returns:
-            Error rate and remaining keys
+            Error rate and remaining uint8 keys
         """
+        alice_key = np.asarray(alice_key, dtype=np.uint8)
+        bob_key = np.asarray(bob_key, dtype=np.uint8)
+        
         if sample_size is None:
             sample_size = min(len(alice_key) // 4, 10)
         
         if len(alice_key) < sample_size:
-            return 1.0, [], []
+            return 1.0, alice_key[:0], bob_key[:0]
         
         # Sample bits for error estimation
-        sample_indices = random.sample(range(len(alice_key)), sample_size)
-        sample_indices.sort(reverse=True)
+        sample_indices = self._rng.choice(len(alice_key), sample_size, replace=False)
+        errors = int(np.count_nonzero(alice_key[sample_indices] != bob_key[sample_indices]))
         
-        errors = 0
-        for idx in sample_indices:
-            if alice_key[idx] != bob_key[idx]:
-                errors += 1
-            alice_key.pop(idx)
-            bob_key.pop(idx)
+        # Discard the revealed sample bits
+        keep = np.ones(len(alice_key), dtype=bool)
+        keep[sample_indices] = False
         
         error_rate = errors / sample_size if sample_size > 0 else 0
         
-        return error_rate, alice_key, bob_key
+        return error_rate, alice_key[keep], bob_key[keep]
     
     def run_protocol(self):
         """
@@ -197,8 +249,8 @@ class BB84Protocol:
         n_bits = self.key_length * 4
         
         # Step 1: Alice generates random bits and bases
-        alice_bits = [random.randint(0, 1) for _ in range(n_bits)]
-        alice_bases = [random.randint(0, 1) for _ in range(n_bits)]
+        alice_bits = self._rng.integers(0, 2, n_bits, dtype=np.uint8)
+        alice_bases = self._rng.integers(0, 2, n_bits, dtype=np.uint8)
         
         # Step 2: Alice encodes and sends qubits
         message = self.encode_message(alice_bits, alice_bases)
@@ -209,7 +261,7 @@ class BB84Protocol:
             print(f"Eve intercepted {len(message)} qubits")
         
         # Step 4: Bob chooses random bases and measures
-        bob_bases = [random.randint(0, 1) for _ in range(n_bits)]
+        bob_bases = self._rng.integers(0, 2, n_bits, dtype=np.uint8)
         bob_results = self.measure_message(message, bob_bases)
         
         # Step 5: Sift keys (keep only matching bases)
@@ -240,7 +292,7 @@ class BB84Protocol:
             'key_length': len(final_alice_key),
             'error_rate': error_rate,
             'secure': secure,
-            'keys_match': final_alice_key == final_bob_key
+            'keys_match': np.array_equal(final_alice_key, final_bob_key)
         }
 
 class QuantumEncryption:
@@ -248,6 +300,32 @@ class QuantumEncryption:
     Simple encryption using quantum-generated keys
     """
     
+    @staticmethod
+    def _key_stream(key, n_bytes):
+        """
+        Repeat the key bits to cover n_bytes and pack them into bytes
+        
+        Args:
+            key: Binary key from QKD
+            n_bytes: Number of key bytes needed
+        
+        Returns:
+            Array of n_bytes key bytes
+        
+        Raises:
+            ValueError: If the key is empty
+        """
+        key = np.asarray(key, dtype=np.uint8)
+        if len(key) == 0:
+            raise ValueError("Cannot encrypt with an empty key")
+        
+        # The repeated key lines up with byte boundaries every lcm(len, 8)
+        # bits, so only that period is packed and then tiled
+        period_bits = len(key) * 8 // math.gcd(len(key), 8)
+        period = np.packbits(np.resize(key, period_bits))
+        
+        return np.resize(period, n_bytes)
+    
     @staticmethod
     def xor_encrypt(message, key):
         """
@@ -258,22 +336,12 @@ class QuantumEncryption:
             key: Binary key from QKD
         
         Returns:
-            Encrypted message
+            Encrypted message bytes
         """
-        # Convert message to binary
-        message_binary = ''.join(format(ord(c), '08b') for c in message)
-        
-        # Repeat key if necessary
-        key_string = ''.join(str(bit) for bit in key)
-        while len(key_string) < len(message_binary):
-            key_string += key_string
+        message_bytes = np.frombuffer(message.encode('utf-8'), dtype=np.uint8)
+        key_bytes = QuantumEncryption._key_stream(key, len(message_bytes))
         
-        # XOR encryption
-        encrypted = ''
-        for i in range(len(message_binary)):
-            encrypted += str(int(message_binary[i]) ^ int(key_string[i]))
-        
-        return encrypted
+        return (message_bytes ^ key_bytes).tobytes()
     
     @staticmethod
     def xor_decrypt(encrypted, key):
@@ -281,29 +349,20 @@ class QuantumEncryption:
         XOR decryption using the quantum key
         
         Args:
-            encrypted: Encrypted binary string
+            encrypted: Encrypted message bytes
             key: Binary key from QKD
         
         Returns:
             Decrypted message
+        
+        Raises:
+            UnicodeDecodeError: If the key or ciphertext is wrong and the
+                decrypted bytes are not valid UTF-8
         """
-        # Repeat key if necessary
-        key_string = ''.join(str(bit) for bit in key)
-        while len(key_string) < len(encrypted):
-            key_string += key_string
-        
-        # XOR decryption
-        decrypted_binary = ''
-        for i in range(len(encrypted)):
-            decrypted_binary += str(int(encrypted[i]) ^ int(key_string[i]))
-        
-        # Convert binary to text
-        decrypted = ''
-        for i in range(0, len(decrypted_binary), 8):
-            byte = decrypted_binary[i:i+8]
-            decrypted += chr(int(byte, 2))
-        
-        return decrypted
+        encrypted_bytes = np.frombuffer(encrypted, dtype=np.uint8)
+        key_bytes = QuantumEncryption._key_stream(key, len(encrypted_bytes))
+        
+        return (encrypted_bytes ^ key_bytes).tobytes().decode('utf-8')
 
 # Example usage
 def main():
@@ -345,7 +404,7 @@ def main():
         # Encrypt
         encrypted = QuantumEncryption.xor_encrypt(message, quantum_key)
         print(f"Original message: {message}")
-        print(f"Encrypted (binary): {encrypted[:32]}...")
+        print(f"Encrypted (hex): {encrypted.hex()[:32]}...")
         
         # Decrypt
         decrypted = QuantumEncryption.xor_decrypt(encrypted, quantum_key)